@@ -4,147 +4,436 @@ PDF 转思维导图工具
 读取 PDF 文件，提取内容并生成 Markdown 格式的思维导图
 """
 
+import asyncio
+import hashlib
+import io
 import os
 import re
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from docx import Document
-from openai import OpenAI
-from dotenv import load_dotenv
+
+# 并发调用 LLM API 的最大数量（避免触发限流）
+MAX_CONCURRENT_REQUESTS = 8
+
+# WordprocessingML 命名空间
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# 提取结果缓存目录（按文件内容哈希命名）
+CACHE_DIR = Path(".cache")
+
+
+def _file_content_hash(path):
+    """计算文件内容的 blake2b 摘要，作为提取缓存的键"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_cached_text(kind, key):
+    """读取提取缓存，不存在时返回 None"""
+    cache_file = CACHE_DIR / kind / f"{key}.txt"
+    if cache_file.exists():
+        return cache_file.read_text(encoding="utf-8")
+    return None
+
+
+def _save_cached_text(kind, key, text):
+    """原子写入提取缓存（先写临时文件再 os.replace）"""
+    cache_dir = CACHE_DIR / kind
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir / f"{key}.txt"
+    tmp_file = cache_dir / f"{key}.txt.tmp"
+    tmp_file.write_bytes(text.encode("utf-8"))
+    os.replace(tmp_file, cache_file)
+
+
+def _extract_docx_part_text(stream):
+    """流式解析单个 WordprocessingML 文档部件，返回段落文本列表"""
+    paragraphs = []
+    runs = []
+
+    # 热循环：标签名和 append 方法提到循环外，省去每个节点的重复查找
+    t_tag = f"{_W_NS}t"
+    p_tag = f"{_W_NS}p"
+    append_run = runs.append
+    append_paragraph = paragraphs.append
+
+    # iterparse 增量解析，逐个拿到 <w:t> 文本节点后立即 clear() 释放内存
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        if elem.tag == t_tag:
+            if elem.text:
+                append_run(elem.text)
+        elif elem.tag == p_tag:
+            text = "".join(runs).strip()
+            if text:
+                append_paragraph(text)
+            runs.clear()
+            elem.clear()
+
+    # 表格单元格等不在 <w:p> 内的残留文本
+    if runs:
+        text = "".join(runs).strip()
+        if text:
+            paragraphs.append(text)
+
+    return paragraphs
 
 
 def extract_docx_text(docx_path):
-    """提取 Word 文档文本内容"""
-    import sys
+    """提取 Word 文档文本内容（直接解析 word/document.xml，不经过 python-docx）"""
+    # 内容没变的文件直接复用上次的提取结果
+    cache_key = _file_content_hash(docx_path)
+    cached = _load_cached_text("docx", cache_key)
+    if cached is not None:
+        print(f"DOCX 提取命中缓存: {docx_path}")
+        return cached
 
     print(f"正在读取 DOCX: {docx_path}")
-    sys.stdout.flush()
 
-    doc = Document(docx_path)
     text_content = []
+    paragraph_count = 0
+
+    with zipfile.ZipFile(docx_path) as zf:
+        # 正文在 word/document.xml，页眉页脚在 word/header*.xml / word/footer*.xml
+        part_names = [
+            name for name in zf.namelist()
+            if name == "word/document.xml"
+            or re.match(r"word/(header|footer)\d*\.xml$", name)
+        ]
+        part_names.sort(key=lambda name: name != "word/document.xml")
+
+        for name in part_names:
+            with zf.open(name) as stream:
+                paragraphs = _extract_docx_part_text(stream)
+            if name == "word/document.xml":
+                paragraph_count = len(paragraphs)
+            text_content.extend(paragraphs)
+
+    # 页眉页脚、页码之类的短行会重复出现几十上百次，
+    # 去重可以明显减少送入 LLM 的 token 数
+    recent_hashes = deque(maxlen=50)
+    deduped = []
+    for line in text_content:
+        if len(line) < 80:
+            line_hash = hash(line)
+            if line_hash in recent_hashes:
+                continue
+            recent_hashes.append(line_hash)
+        deduped.append(line)
 
-    # 读取所有段落
-    for i, para in enumerate(doc.paragraphs):
-        text = para.text.strip()
-        if text:
-            text_content.append(text)
-
-        if (i + 1) % 100 == 0:
-            print(f"处理第 {i+1} 段")
-            sys.stdout.flush()
-
-    # 读取所有表格
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                text = cell.text.strip()
-                if text:
-                    text_content.append(text)
+    removed = len(text_content) - len(deduped)
+    if removed:
+        print(f"去除重复段落: {removed}/{len(text_content)}")
 
-    full_text = "\n".join(text_content)
+    full_text = "\n".join(deduped)
+    _save_cached_text("docx", cache_key, full_text)
     print(f"DOCX 文本提取完成")
-    print(f"总段落数: {len(doc.paragraphs)}")
+    print(f"总段落数: {paragraph_count}")
     print(f"总字符数: {len(full_text)}")
-    sys.stdout.flush()
 
     return full_text
 
 
+# 页数少于这个值时进程池的启动开销不划算，直接单进程处理
+_MIN_PAGES_FOR_POOL = 16
+
+
+def _shard_page_indices(pages_to_process, num_shards):
+    """把页码交错切分成若干片，让各进程的负载尽量均衡"""
+    return [list(range(i, pages_to_process, num_shards)) for i in range(num_shards)]
+
+
+def _extract_pdf_pages_pymupdf(pdf_path, page_indices):
+    """在工作进程中用 PyMuPDF 提取指定页，返回 (页码, 文本) 列表"""
+    import fitz
+
+    doc = fitz.open(pdf_path)
+    results = []
+    for idx in page_indices:
+        text = doc[idx].get_text()
+        if text and text.strip():
+            results.append((idx, text))
+    doc.close()
+    return results
+
+
+def _extract_pdf_pages_pdfplumber(pdf_path, page_indices):
+    """在工作进程中用 pdfplumber 提取指定页，返回 (页码, 文本) 列表"""
+    import pdfplumber
+
+    results = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for idx in page_indices:
+            page = pdf.pages[idx]
+            text = page.extract_text()
+            if text:
+                results.append((idx, text))
+            # 释放已解析页的对象缓存，把工作集压到单页大小
+            page.flush_cache()
+    return results
+
+
+def _extract_pdf_pages_parallel(worker, pdf_path, pages_to_process):
+    """页提取按 CPU 核数分片并行，按页码排序合并后返回 (全文, 有效页数)"""
+    num_workers = min(os.cpu_count() or 1, pages_to_process)
+
+    if pages_to_process < _MIN_PAGES_FOR_POOL or num_workers <= 1:
+        results = worker(str(pdf_path), list(range(pages_to_process)))
+    else:
+        shards = _shard_page_indices(pages_to_process, num_workers)
+        results = []
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            for shard_results in pool.map(worker, repeat(str(pdf_path)), shards):
+                results.extend(shard_results)
+
+    results.sort(key=lambda item: item[0])
+
+    # 直接写入 StringIO 并随手丢弃每页字符串，避免 join 时内存翻倍
+    buf = io.StringIO()
+    valid_pages = 0
+    for i, (_, text) in enumerate(results):
+        if valid_pages:
+            buf.write("\n\n")
+        buf.write(text)
+        valid_pages += 1
+        results[i] = None
+
+    return buf.getvalue(), valid_pages
+
+
 def extract_pdf_text_pymupdf(pdf_path, max_pages=None):
     """使用 PyMuPDF 提取 PDF 文本内容"""
-    import sys
-    text_content = []
+    import fitz
 
     print(f"正在读取 PDF (PyMuPDF): {pdf_path}")
-    sys.stdout.flush()
 
     doc = fitz.open(pdf_path)
     total_pages = len(doc)
+    doc.close()
     pages_to_process = min(max_pages, total_pages) if max_pages else total_pages
 
     print(f"PDF 总页数: {total_pages}，将处理: {pages_to_process} 页")
-    sys.stdout.flush()
-
-    for i in range(pages_to_process):
-        if (i + 1) % 10 == 0:  # 每10页输出一次
-            print(f"处理第 {i+1}/{pages_to_process} 页")
-            sys.stdout.flush()
-        page = doc[i]
-        text = page.get_text()
-        if text and text.strip():
-            text_content.append(text)
 
-    doc.close()
+    full_text, valid_pages = _extract_pdf_pages_parallel(
+        _extract_pdf_pages_pymupdf, pdf_path, pages_to_process
+    )
 
-    print(f"PDF 文本提取完成，共 {len(text_content)} 页有效内容")
-    print(f"总字符数: {sum(len(t) for t in text_content)}")
-    sys.stdout.flush()
-    return "\n\n".join(text_content)
+    print(f"PDF 文本提取完成，共 {valid_pages} 页有效内容")
+    print(f"总字符数: {len(full_text)}")
+    return full_text
 
 
 def extract_pdf_text(pdf_path, max_pages=None):
     """提取 PDF 文本内容（优先使用 PyMuPDF）"""
-    import sys
+    # 内容没变的文件直接复用上次的提取结果（页数限制也参与缓存键）
+    cache_key = f"{_file_content_hash(pdf_path)}-p{max_pages or 'all'}"
+    cached = _load_cached_text("pdf", cache_key)
+    if cached is not None:
+        print(f"PDF 提取命中缓存: {pdf_path}")
+        return cached
 
     # 先尝试使用 PyMuPDF
+    text = ""
     try:
         text = extract_pdf_text_pymupdf(pdf_path, max_pages)
         if text and len(text.strip()) > 100:  # 如果提取到了有效文本
+            _save_cached_text("pdf", cache_key, text)
             return text
         print(f"PyMuPDF 提取文本太少，尝试使用 pdfplumber")
-        sys.stdout.flush()
     except Exception as e:
         print(f"PyMuPDF 提取失败: {e}，尝试使用 pdfplumber")
-        sys.stdout.flush()
 
-    # 如果 PyMuPDF 失败，尝试 pdfplumber
-    text_content = []
+    # 如果 PyMuPDF 失败，尝试 pdfplumber；仅在走到兜底路径时才导入，
+    # 没装 pdfplumber 时退回 PyMuPDF 的部分结果
+    try:
+        import pdfplumber
+    except ImportError:
+        # 不写缓存：这是环境缺依赖的退化结果，装上 pdfplumber 后应能重新提取
+        print(f"未安装 pdfplumber，使用 PyMuPDF 的部分提取结果")
+        return text
+
     print(f"正在读取 PDF (pdfplumber): {pdf_path}")
-    sys.stdout.flush()
 
     with pdfplumber.open(pdf_path) as pdf:
         total_pages = len(pdf.pages)
-        pages_to_process = min(max_pages, total_pages) if max_pages else total_pages
+    pages_to_process = min(max_pages, total_pages) if max_pages else total_pages
 
-        print(f"PDF 总页数: {total_pages}，将处理: {pages_to_process} 页")
-        sys.stdout.flush()
+    print(f"PDF 总页数: {total_pages}，将处理: {pages_to_process} 页")
 
-        for i, page in enumerate(pdf.pages[:pages_to_process]):
-            if (i + 1) % 10 == 0:  # 每10页输出一次
-                print(f"处理第 {i+1}/{pages_to_process} 页")
-                sys.stdout.flush()
-            text = page.extract_text()
-            if text:
-                text_content.append(text)
+    full_text, valid_pages = _extract_pdf_pages_parallel(
+        _extract_pdf_pages_pdfplumber, pdf_path, pages_to_process
+    )
+
+    print(f"PDF 文本提取完成，共 {valid_pages} 页")
+    _save_cached_text("pdf", cache_key, full_text)
+    return full_text
+
+
+# LLM 请求参数（也参与响应缓存的键）
+_LLM_MODEL = "qwen3-max"
+_LLM_TEMPERATURE = 0.2  # 降低温度以获得更稳定、更符合规则的输出
+
+# 所有请求共享一个客户端，复用连接池
+_llm_client = None
+
+# 限制在途 LLM 请求数的信号量（按单个 API 请求计，而不是按文件计）
+_request_semaphore = None
+
+
+def _get_request_semaphore():
+    """惰性创建共享的请求信号量，分块生成的每个请求都占用一个槽位"""
+    global _request_semaphore
+
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    return _request_semaphore
+
+
+def _get_llm_client(api_key):
+    """惰性创建共享的 AsyncOpenAI 客户端
+
+    默认的 httpx 连接池只有 10 个连接，批量并发时会排队；
+    这里调大连接池并启用 HTTP/2，让并发请求复用同一条 TCP 连接。
+    """
+    global _llm_client
 
-    print(f"PDF 文本提取完成，共 {len(text_content)} 页")
-    sys.stdout.flush()
-    return "\n\n".join(text_content)
+    if _llm_client is None:
+        # 延迟导入，避免不走 API 路径（以及进程池工作进程）也加载 openai
+        import httpx
+        from openai import AsyncOpenAI
 
+        _llm_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                http2=True,
+            ),
+        )
 
-def generate_mindmap_md(pdf_text, pdf_name):
-    """使用 AI API 生成思维导图 Markdown"""
-    import sys
+    return _llm_client
 
+
+async def generate_mindmap_md(pdf_text, pdf_name, md_file=None):
+    """使用 AI API 生成思维导图 Markdown
+
+    传入 md_file 时最终结果以流式方式边生成边写入该文件。
+    """
     api_key = os.getenv("DASHSCOPE_API_KEY")
 
     if not api_key:
         print("警告: 未找到 DASHSCOPE_API_KEY，将使用简单的结构提取")
-        sys.stdout.flush()
-        return generate_simple_mindmap(pdf_text, pdf_name)
+        result = generate_simple_mindmap(pdf_text, pdf_name)
+        if md_file is not None:
+            Path(md_file).write_bytes(result.encode('utf-8'))
+        return result
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
+    client = _get_llm_client(api_key)
 
-    # 如果文本太长，分批处理
     text_length = len(pdf_text)
-    max_chunk_size = 100000  # 每次处理最多 10万字符
-
     print(f"PDF 文本总长度: {text_length} 字符")
-    sys.stdout.flush()
 
-    prompt = f"""请仔细分析以下教材内容，生成一个详细完整的 Markdown 格式背诵脑图。
+    # 文本太长时切块并行生成，再用一次归并调用合成完整脑图（map-reduce）
+    chunks = chunk_text(pdf_text)
+
+    if len(chunks) == 1:
+        result = await _request_mindmap(
+            client, _build_mindmap_prompt(pdf_name, pdf_text), md_file
+        )
+    else:
+        print(f"文本过长，切分为 {len(chunks)} 块并行生成")
+        tasks = [
+            _request_mindmap(
+                client,
+                _build_mindmap_prompt(f"{pdf_name}（第 {i + 1}/{len(chunks)} 部分）", chunk),
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+        partial_outlines = await asyncio.gather(*tasks)
+        print(f"各块思维导图生成完成，正在归并...")
+        result = await _request_mindmap(
+            client, _build_merge_prompt(pdf_name, partial_outlines), md_file
+        )
+
+    print(f"思维导图生成完成，长度: {len(result)} 字符")
+
+    return result
+
+
+# 单块提示词的 token 预算（cl100k_base 作为 Qwen 分词的近似）
+_CHUNK_TOKENS = 60000
+_CHUNK_OVERLAP_TOKENS = 1500
+
+_token_encoder = None
+_token_encoder_failed = False
+
+
+def _get_token_encoder():
+    """惰性加载 tiktoken 编码器，环境缺少 tiktoken 时返回 None"""
+    global _token_encoder, _token_encoder_failed
+
+    if _token_encoder is None and not _token_encoder_failed:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken 不可用（{e}），退回按字符数切块")
+            _token_encoder_failed = True
+
+    return _token_encoder
+
+
+def chunk_text(text, size=80000, overlap=2000):
+    """按段落边界把长文本切成带重叠的块
+
+    有 tiktoken 时按 token 预算切块——中文按字符数切会大幅偏离模型的
+    真实上下文占用；缺少 tiktoken 时退回按 size/overlap 字符数切。
+    """
+    encoder = _get_token_encoder()
+    if encoder is not None:
+        def measure(s):
+            return len(encoder.encode(s))
+        size = _CHUNK_TOKENS
+        overlap = _CHUNK_OVERLAP_TOKENS
+    else:
+        measure = len
+
+    if measure(text) <= size:
+        return [text]
+
+    chunks = []
+    current = []
+    current_len = 0
+    for para in text.split("\n"):
+        para_len = measure(para) + 1
+        if current and current_len + para_len > size:
+            chunks.append("\n".join(current))
+            # 从尾部回带约 overlap 预算的段落，避免知识点在块边界被切断
+            carried = []
+            carried_len = 0
+            while current and carried_len < overlap:
+                carried.append(current.pop())
+                carried_len += measure(carried[-1]) + 1
+            carried.reverse()
+            current = carried
+            current_len = carried_len
+        current.append(para)
+        current_len += para_len
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# 生成思维导图的提示词模板（模块级常量，避免每次调用重新构造大字符串）
+_MINDMAP_PROMPT_TEMPLATE = """请仔细分析以下教材内容，生成一个详细完整的 Markdown 格式背诵脑图。
 
 【格式要求 - 非常重要】
 1. 必须使用标准 Markdown 标题格式：
@@ -379,19 +668,110 @@ def generate_mindmap_md(pdf_text, pdf_name):
 书名：{pdf_name}
 
 教材内容：
-{pdf_text[:max_chunk_size]}
+{pdf_text}
 
 请严格按照上述格式生成完整详细的思维导图："""
 
+# 归并各块思维导图片段的提示词模板
+_MERGE_PROMPT_TEMPLATE = """下面是教材《{pdf_name}》分块生成的 {num_parts} 份 Markdown 思维导图片段，相邻块之间有内容重叠。
+请把它们合并成一个完整的思维导图：
+
+1. 以 # {pdf_name} 作为唯一的一级标题
+2. 相同的章节、小节、知识点合并去重，保留更详细的版本
+3. 严格保持原有的标题层级和数字标注规则不变
+4. 除 Markdown 思维导图本身外，不要输出任何其他内容
+
+思维导图片段：
+
+{partial_outlines}
+
+请输出合并后的完整思维导图："""
+
+
+def _build_mindmap_prompt(pdf_name, pdf_text):
+    """构造生成思维导图的完整提示词"""
+    return _MINDMAP_PROMPT_TEMPLATE.format_map(
+        {'pdf_name': pdf_name, 'pdf_text': pdf_text}
+    )
+
+
+def _build_merge_prompt(pdf_name, partial_outlines):
+    """构造把各块思维导图片段归并成完整脑图的提示词"""
+    return _MERGE_PROMPT_TEMPLATE.format_map({
+        'pdf_name': pdf_name,
+        'num_parts': len(partial_outlines),
+        'partial_outlines': "\n\n---\n\n".join(partial_outlines),
+    })
+
+
+# 流式写盘时每收到这么多增量 flush 一次，避免每个 token 一次系统调用
+_STREAM_FLUSH_INTERVAL = 50
+
+
+async def _stream_completion_to_file(client, prompt, md_file):
+    """流式接收 LLM 响应并边到达边写入 Markdown 文件，返回完整内容"""
+    completion = await _create_completion(client, prompt, stream=True)
+
+    # 二进制模式写入：增量只编码一次，绕过文本层的再编码
+    parts = []
+    pending = 0
+    with open(md_file, "wb") as f:
+        async for chunk in completion:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            f.write(delta.encode("utf-8"))
+            parts.append(delta)
+            pending += 1
+            if pending >= _STREAM_FLUSH_INTERVAL:
+                f.flush()
+                pending = 0
+
+    return "".join(parts)
+
+
+async def _request_mindmap(client, prompt, md_file=None):
+    """调用 LLM 生成思维导图，失败时指数退避重试
+
+    传入 md_file 时启用流式响应，内容一边到达一边写入文件。
+    """
+    # 相同模型 + 温度 + 提示词的响应直接复用，重跑时省掉整次 LLM 调用
+    cache_key = hashlib.sha256(
+        f"{_LLM_MODEL}|{_LLM_TEMPERATURE}|{prompt}".encode("utf-8")
+    ).hexdigest()
+    cached = _load_cached_text("llm", cache_key)
+    if cached is not None:
+        print("LLM 响应命中缓存")
+        if md_file is not None:
+            Path(md_file).write_bytes(cached.encode('utf-8'))
+        return cached
+
     print(f"正在使用 AI 生成详细思维导图...")
-    sys.stdout.flush()
 
-    completion = client.chat.completions.create(
-        model="qwen3-max",
-        messages=[
-            {
-                "role": "system",
-                "content": """你是一个专业的教育专家，擅长分析教材内容并生成详细完整的背诵提示脑图。
+    # 失败时指数退避重试，避免偶发网络错误或限流导致整个文件失败
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            async with _get_request_semaphore():
+                if md_file is None:
+                    completion = await _create_completion(client, prompt)
+                    result = completion.choices[0].message.content
+                else:
+                    result = await _stream_completion_to_file(client, prompt, md_file)
+            _save_cached_text("llm", cache_key, result)
+            return result
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise
+            wait_time = 2 ** (attempt + 1)
+            print(f"API 调用失败: {e}，{wait_time} 秒后重试")
+            await asyncio.sleep(wait_time)
+
+
+# 系统提示词（所有请求共享同一前缀，便于服务端 prefix cache 命中）
+_SYSTEM_PROMPT = """你是一个专业的教育专家，擅长分析教材内容并生成详细完整的背诵提示脑图。
 
 🔴🔴🔴 核心任务：生成背诵提示脑图（不是答案展示脑图）🔴🔴🔴
 
@@ -422,28 +802,30 @@ def generate_mindmap_md(pdf_text, pdf_name):
 
 【核心原则】
 脑图是背诵提示工具，用户看到"竞争性抑制 6"就知道要背6个要点，看到知识点名称就能回忆内容。绝对不要把答案写出来！"""
+
+
+async def _create_completion(client, prompt, stream=False):
+    """调用 LLM API 生成思维导图"""
+    return await client.chat.completions.create(
+        model=_LLM_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": _SYSTEM_PROMPT
             },
             {
                 "role": "user",
                 "content": prompt
             }
         ],
-        temperature=0.2,  # 降低温度以获得更稳定、更符合规则的输出
+        temperature=_LLM_TEMPERATURE,
+        stream=stream,
     )
 
-    result = completion.choices[0].message.content
-    print(f"思维导图生成完成，长度: {len(result)} 字符")
-    sys.stdout.flush()
-
-    return result
-
 
 def remove_intermediate_numbers(md_text):
     """移除中间节点的数字标注,只保留叶子节点的数字"""
-    import sys
-
     print("正在移除中间节点的数字标注...")
-    sys.stdout.flush()
 
     lines = md_text.split('\n')
     result = []
@@ -476,27 +858,27 @@ def remove_intermediate_numbers(md_text):
         result.append(line)
 
     print("中间节点数字移除完成")
-    sys.stdout.flush()
     return '\n'.join(result)
 
 
+# 章节标题：如 "第三章"、"第12节" 或 "1." / "2、" 开头的行
+_SECTION_RE = re.compile(r'^(?:第[一二三四五六七八九十\d]+[章节]|\d+[\.\、])')
+
+
 def generate_simple_mindmap(pdf_text, pdf_name):
     """简单的思维导图生成（不使用 API）"""
-    lines = pdf_text.split('\n')
-
     # 简单的结构提取逻辑
     mindmap = [f"# {pdf_name}"]
     mindmap.append("")
 
     current_section = None
-    for line in lines[:500]:  # 只处理前 500 行
+    for line in pdf_text.split('\n'):
         line = line.strip()
         if not line:
             continue
 
         # 检测章节标题（通常是数字开头或者较短的行）
-        if re.match(r'^第[一二三四五六七八九十\d]+[章节]', line) or \
-           re.match(r'^\d+[\.\、]', line):
+        if _SECTION_RE.match(line):
             if len(line) < 50:
                 mindmap.append(f"## {line}")
                 current_section = line
@@ -506,8 +888,11 @@ def generate_simple_mindmap(pdf_text, pdf_name):
     return "\n".join(mindmap)
 
 
-def convert_md_to_xmind(md_file, output_dir="output"):
-    """使用 md2xmind 转换 Markdown 到 XMind"""
+def convert_md_to_xmind(md_file, output_dir="output", mindmap_md=None):
+    """使用 md2xmind 转换 Markdown 到 XMind
+
+    传入 mindmap_md 时直接在内存中转换，不再从磁盘回读 .md 文件。
+    """
     import md2xmind
 
     output_path = Path(output_dir)
@@ -520,7 +905,10 @@ def convert_md_to_xmind(md_file, output_dir="output"):
     try:
         # 使用 md2xmind API
         topic_name = Path(md_file).stem
-        md2xmind.start_trans_file(str(md_file), str(xmind_file), topic_name)
+        if mindmap_md is not None:
+            md2xmind.start_trans_content(mindmap_md, str(xmind_file), topic_name)
+        else:
+            md2xmind.start_trans_file(str(md_file), str(xmind_file), topic_name)
         print(f"转换成功: {xmind_file}")
         return xmind_file
     except Exception as e:
@@ -530,9 +918,73 @@ def convert_md_to_xmind(md_file, output_dir="output"):
         return None
 
 
-def main():
+async def _produce_texts(docx_files, queue):
+    """生产者：在线程中逐个提取 DOCX 文本并放入队列"""
+    for docx_file in docx_files:
+        print(f"\n{'='*60}")
+        print(f"处理: {docx_file.name}")
+        print(f"{'='*60}")
+
+        try:
+            doc_text = await asyncio.to_thread(extract_docx_text, docx_file)
+        except Exception as e:
+            print(f"提取 {docx_file.name} 失败: {e}")
+            import traceback
+            traceback.print_exc()
+            continue
+
+        if not doc_text or len(doc_text.strip()) == 0:
+            print(f"警告: DOCX 文本为空或无法提取，跳过此文件")
+            continue
+
+        await queue.put((docx_file, doc_text))
+
+    # 结束哨兵
+    await queue.put(None)
+
+
+async def _consume_texts(queue, output_dir):
+    """消费者：从队列取出提取好的文本，为每个文件启动生成任务"""
+    tasks = []
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        docx_file, doc_text = item
+        tasks.append(
+            asyncio.create_task(process_one(docx_file, doc_text, output_dir))
+        )
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def process_one(docx_file, doc_text, output_dir):
+    """处理单个 DOCX 文件：生成思维导图并转换 XMind（文本已提取好）"""
+    try:
+        # 1. 生成思维导图 Markdown 并流式写入文件
+        # （在途请求数由 _request_mindmap 里的信号量按单个请求限制）
+        doc_name = docx_file.stem
+        md_file = output_dir / f"{doc_name}.md"
+        mindmap_md = await generate_mindmap_md(doc_text, doc_name, md_file)
+        print(f"已保存 Markdown: {md_file}")
+
+        # 2. 直接用内存中的 Markdown 转换为 XMind，转换放线程里跑，
+        # 不阻塞其他文件在途的 LLM 请求
+        xmind_file = await asyncio.to_thread(
+            convert_md_to_xmind, md_file, output_dir, mindmap_md
+        )
+
+    except Exception as e:
+        print(f"处理 {docx_file.name} 时出错: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+async def main():
     """主函数"""
     # 加载环境变量
+    from dotenv import load_dotenv
     load_dotenv()
 
     data_dir = Path("data")
@@ -548,37 +1000,13 @@ def main():
 
     print(f"找到 {len(docx_files)} 个 DOCX 文件")
 
-    for docx_file in docx_files:
-        print(f"\n{'='*60}")
-        print(f"处理: {docx_file.name}")
-        print(f"{'='*60}")
-
-        try:
-            # 1. 提取 DOCX 文本
-            doc_text = extract_docx_text(docx_file)
-
-            if not doc_text or len(doc_text.strip()) == 0:
-                print(f"警告: DOCX 文本为空或无法提取，跳过此文件")
-                continue
-
-            # 2. 生成思维导图 Markdown
-            doc_name = docx_file.stem
-            mindmap_md = generate_mindmap_md(doc_text, doc_name)
-
-            # 3. 保存 Markdown 文件
-            md_file = output_dir / f"{doc_name}.md"
-            with open(md_file, 'w', encoding='utf-8') as f:
-                f.write(mindmap_md)
-            print(f"已保存 Markdown: {md_file}")
-
-            # 4. 转换为 XMind
-            xmind_file = convert_md_to_xmind(md_file, output_dir)
-
-        except Exception as e:
-            print(f"处理 {docx_file.name} 时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
+    # 生产者在线程中提取下一个文件的文本，消费者同时等待在途的 LLM 响应，
+    # 让 CPU 提取和网络 I/O 重叠；LLM 请求数由请求级信号量限制
+    queue = asyncio.Queue(maxsize=2)
+    await asyncio.gather(
+        _produce_texts(docx_files, queue),
+        _consume_texts(queue, output_dir),
+    )
 
     print(f"\n{'='*60}")
     print("全部处理完成！")
@@ -586,4 +1014,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())